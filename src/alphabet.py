@@ -12,6 +12,8 @@ class Alphabet:
 
     _map: dict[str, int]
     _revmap: dict[int, str]
+    _bytes_map: bytes
+    _unmapped_bytes: bytes
 
     def __init__(self, reference: str) -> None:
         """
@@ -38,6 +40,14 @@ class Alphabet:
         assert len(self._map) <= 256, \
             "Cannot handle alphabets we cannot fit into bytes"  # noqal: E501
 
+        # Translation table for map_bytes(), and the bytes that are not
+        # letters and that translation should delete. The sentinel is
+        # in _map, but it is never a letter in a string we map.
+        self._bytes_map = bytes(self._map.get(chr(b), 0) for b in range(256))
+        self._unmapped_bytes = bytes(
+            b for b in range(256) if b == 0 or chr(b) not in self._map
+        )
+
     def __len__(self) -> int:
         """Return the number of letters in the alphabet."""
         return len(self._map)
@@ -51,6 +61,20 @@ class Alphabet:
         """
         return bytearray(self._map[a] for a in x)
 
+    def map_bytes(self, x: bytes) -> bytes:
+        """
+        Map the latin-1 encoded string x to the letters in the alphabet.
+
+        This is the same as map(), but for a string that is already
+        encoded as bytes, which lets us map it with a single translate.
+        If x contains a letter not in the alphabet, or the sentinel byte
+        zero, map_bytes raises a KeyError.
+        """
+        y = x.translate(self._bytes_map, self._unmapped_bytes)
+        if len(y) != len(x):
+            raise KeyError("String contains letters not in the alphabet")
+        return y
+
     def map_with_sentinel(self, x: Iterable[str]) -> bytearray:
         """
         Map x to the bytes in the alphabet.
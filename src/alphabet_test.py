@@ -1,5 +1,7 @@
 """Test alphabet code."""
 
+import pytest
+
 from alphabet import Alphabet
 
 
@@ -19,6 +21,16 @@ def test_alphabet() -> None:
         assert alpha.revmap(subs) == x
 
 
+def test_map_bytes() -> None:
+    """Test mapping encoded strings."""
+    alpha = Alphabet("foobar")
+    for x in ["foo", "bar", "", "raboof"]:
+        assert alpha.map_bytes(x.encode("latin-1")) == alpha.map(x)
+    for x in ["baz", "z", "foo\xe6", "\x00", "f\x00o"]:
+        with pytest.raises(KeyError):
+            alpha.map_bytes(x.encode("latin-1"))
+
+
 if __name__ == '__main__':
     for name, f in list(globals().items()):
         if name.startswith("test_"):
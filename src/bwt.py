@@ -1,20 +1,28 @@
 """Implementatin of the Burrows-Wheeler transform and related algorithms."""
 
+from __future__ import annotations
 from typing import (
-    Iterator, Callable,
-    NamedTuple
+    Any, Iterator, Callable,
+    Mapping, NamedTuple
 )
 
+import numpy as np
+
 from alphabet import Alphabet
+import bwt_kernels
+from bwt_kernels import SYMBOLS_PER_WORD, LOW_BITS
 from sais import sais_alphabet
 from subseq import SubSeq
 
 ExactSearchFunc = Callable[[str], Iterator[int]]
+# A compiled backward search kernel and the O-table arrays it needs,
+# see OTable.search_kernel().
+SearchKernel = tuple[Callable[..., tuple[int, int]], tuple[Any, ...]]
 
 
 def burrows_wheeler_transform(
     x: str
-) -> tuple[bytearray, Alphabet, list[int]]:
+) -> tuple[bytearray, Alphabet, np.ndarray]:
     """
     Construct the Burrows-Wheeler transform.
 
@@ -22,14 +30,24 @@ def burrows_wheeler_transform(
     x to a new alphabet.
 
     Returns the transformed string, the mapping alphabet,
-    and the suffix array over x.
+    and the suffix array over x. The suffix array is a NumPy array
+    of 32-bit integers, unless x is too long for that.
     """
     x_, alpha = Alphabet.mapped_string_with_sentinel(x)
-    sa = sais_alphabet(SubSeq[int](x_), alpha)
-    bwt = bytearray(x_[j - 1] for j in sa)
+    sa_dtype = np.int32 if len(x_) <= np.iinfo(np.int32).max else np.int64
+    sa = np.asarray(sais_alphabet(SubSeq[int](x_), alpha), dtype=sa_dtype)
+    # bwt[i] = x_[sa[i] - 1], where index -1 wraps around to the
+    # sentinel at the end of x_, just as it does for Python sequences.
+    x_np = np.frombuffer(x_, dtype=np.uint8)
+    bwt = bytearray(x_np[sa - 1].tobytes())
     return bwt, alpha, sa
 
 
+def _exclusive_cumsum(counts: np.ndarray) -> list[int]:
+    """Get the cumulative sum, shifted so we count letters < a."""
+    return np.concatenate(([0], np.cumsum(counts)[:-1])).tolist()
+
+
 class CTable:
     """
     C-table for other bwt/fm-index search algorithms.
@@ -49,21 +67,302 @@ class CTable:
         the alphabet size.
         """
         # Count occurrences of characters in bwt
-        counts = [0] * asize
-        for a in bwt:
-            counts[a] += 1
-        # Get the cumulative sum
-        n = 0
-        for a, count in enumerate(counts):
-            counts[a] = n
-            n += count
+        counts = np.bincount(np.frombuffer(bwt, dtype=np.uint8),
+                             minlength=asize)
         # That is all we need...
-        self._cumsum = counts
+        self._cumsum = _exclusive_cumsum(counts)
 
     def __getitem__(self, a: int) -> int:
         """Get the number of occurrences of letters in the bwt less than a."""
         return self._cumsum[a]
 
+    @staticmethod
+    def from_otable(otab: OTable, n: int) -> CTable:
+        """
+        Build a C-table from the O-table for a bwt of length n.
+
+        The O-table already counts every letter, so we don't have to
+        run through the bwt again.
+        """
+        counts = [1]  # there is exactly one $
+        counts.extend(otab.rank(a, n) for a in range(1, otab.asize))
+        ctab = CTable.__new__(CTable)
+        ctab._cumsum = _exclusive_cumsum(np.asarray(counts))
+        return ctab
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Get the arrays that make up the table, see from_arrays()."""
+        return {"cumsum": np.asarray(self._cumsum, dtype=np.int64)}
+
+    @staticmethod
+    def from_arrays(cumsum: np.ndarray) -> CTable:
+        """Rebuild a C-table from the arrays we got from arrays()."""
+        ctab = CTable.__new__(CTable)
+        ctab._cumsum = cumsum.tolist()
+        return ctab
+
+
+# Number of bwt symbols we process at a time when building O-tables.
+OTABLE_TILE = 1 << 18
+
+
+def _block_samples(bwt: bytearray, asize: int,
+                   block_size: int) -> np.ndarray:
+    """
+    Compute sampled occurrence counts for the bwt string.
+
+    Entry [a-1,k] in the result is the number of occurrences of a
+    in bwt[:k*block_size]. We exclude $ from lookups, so there are
+    asize-1 rows, and we need to index to len(bwt), so there is a
+    sample for every complete block plus the zero sample at index 0.
+    The counts are 32-bit, so the bwt must be shorter than 2**32.
+    """
+    assert len(bwt) < 1 << 32, "Counts must fit in 32 bits"
+    nblocks = len(bwt) // block_size
+    samples = np.zeros((asize - 1, nblocks + 1), dtype=np.uint32)
+    # Sample k is the running sum of the per-block counts. We run
+    # through the bwt a tile of whole blocks at a time, comparing each
+    # tile against all letters at once, so we only load the bwt once
+    # and the temporary arrays stay in cache. The counts at the end of
+    # a tile carry over to the next.
+    bwt_np = np.frombuffer(bwt, dtype=np.uint8)
+    letters = np.arange(1, asize, dtype=np.uint8)[:, None, None]
+    tile_blocks = max(1, OTABLE_TILE // (block_size * max(1, asize - 1)))
+    for start in range(0, nblocks, tile_blocks):
+        end = min(start + tile_blocks, nblocks)
+        blocks = bwt_np[start * block_size:end * block_size] \
+            .reshape(end - start, block_size)
+        counts = (blocks == letters).sum(axis=2, dtype=np.uint32)
+        np.cumsum(counts, axis=1, out=samples[:, start + 1:end + 1])
+        samples[:, start + 1:end + 1] += samples[:, start:start + 1]
+    return samples
+
+
+class _DenseOTable:
+    """
+    O-table with all the counts.
+
+    This is the full table, so lookups are a single index, but it
+    takes asize-1 integers per bwt symbol, so we only use it for short
+    strings. See OTable.
+    """
+
+    kind = "dense"
+
+    _tbl: np.ndarray
+
+    def __init__(self, bwt: bytearray, asize: int) -> None:
+        """Create the full O-table for the bwt string."""
+        # The full table is the sampled table with a sample at
+        # every index.
+        self._tbl = _block_samples(bwt, asize, 1)
+
+    @property
+    def asize(self) -> int:
+        """Get the size of the alphabet the table is over, including $."""
+        return len(self._tbl) + 1
+
+    def rank(self, a: int, i: int) -> int:
+        """Get the number of occurrences j < i where bwt[j] == a."""
+        return int(self._tbl[a - 1, i])
+
+    def search_kernel(self) -> SearchKernel:
+        """Get the compiled backward search and the arguments it needs."""
+        return bwt_kernels.dense_backward_search, (self._tbl,)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Get the arrays that make up the table, see from_arrays()."""
+        return {"tbl": self._tbl}
+
+    @staticmethod
+    def from_arrays(tbl: np.ndarray) -> _DenseOTable:
+        """Rebuild an O-table from the arrays we got from arrays()."""
+        otab = _DenseOTable.__new__(_DenseOTable)
+        otab._tbl = tbl
+        return otab
+
+
+class _SampledOTable:
+    """
+    O-table sampled at every block_size'th index.
+
+    We do not store the full table. We keep the counts at every
+    block_size'th index, together with the bwt string, and count the
+    occurrences in the last partial block when we look up a value.
+    See OTable.
+    """
+
+    kind = "sampled"
+
+    _bwt: np.ndarray
+    _block_size: int
+    _samples: np.ndarray
+
+    def __init__(self, bwt: bytearray, asize: int,
+                 block_size: int = 64) -> None:
+        """
+        Create O-table.
+
+        Compute the O-table from the bwt transformed string and the size
+        of the alphabet the bwt string is over. The table is sampled
+        at every block_size'th index.
+        """
+        self._bwt = np.frombuffer(bwt, dtype=np.uint8)
+        self._block_size = block_size
+        self._samples = _block_samples(bwt, asize, block_size)
+
+    @property
+    def asize(self) -> int:
+        """Get the size of the alphabet the table is over, including $."""
+        return len(self._samples) + 1
+
+    def rank(self, a: int, i: int) -> int:
+        """Get the number of occurrences j < i where bwt[j] == a."""
+        block = i // self._block_size
+        start = block * self._block_size
+        return int(self._samples[a - 1, block]) + \
+            int(np.count_nonzero(self._bwt[start:i] == a))
+
+    def search_kernel(self) -> SearchKernel:
+        """Get the compiled backward search and the arguments it needs."""
+        return bwt_kernels.backward_search, \
+            (self._samples, self._bwt, self._block_size)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Get the arrays that make up the table, see from_arrays()."""
+        return {
+            "bwt": self._bwt,
+            "block_size": np.asarray(self._block_size),
+            "samples": self._samples,
+        }
+
+    @staticmethod
+    def from_arrays(bwt: np.ndarray, block_size: np.ndarray,
+                    samples: np.ndarray) -> _SampledOTable:
+        """Rebuild an O-table from the arrays we got from arrays()."""
+        otab = _SampledOTable.__new__(_SampledOTable)
+        otab._bwt = bwt
+        otab._block_size = int(block_size)
+        otab._samples = samples
+        return otab
+
+
+# The low bit of every 2-bit symbol in a word, as a Python int for
+# the Python rank, so it matches the compiled kernels.
+_LOW_BITS = int(LOW_BITS)
+
+
+def pack_2bit(bwt: bytearray) -> np.ndarray:
+    """
+    Pack a bwt string over at most four letters plus $ into words.
+
+    Letter a is stored as the two bits a-1, so $ shares its code with
+    letter 1, and symbol j is at bits 2*(j%32) of word j//32. The last
+    word is padded with zero bits.
+    """
+    # We pack four symbols to a byte, and read the bytes as
+    # little-endian words, so we never widen the symbols to words.
+    nwords = -(-len(bwt) // SYMBOLS_PER_WORD)
+    codes = np.zeros(nwords * SYMBOLS_PER_WORD, dtype=np.uint8)
+    codes[:len(bwt)] = np.frombuffer(bwt, dtype=np.uint8)
+    np.subtract(codes, 1, out=codes, where=codes > 0)
+    quads = codes.reshape(-1, 4)
+    packed = quads[:, 0] | quads[:, 1] << 2 \
+        | quads[:, 2] << 4 | quads[:, 3] << 6
+    return packed.view("<u8").astype(np.uint64, copy=False)
+
+
+class _PackedOTable:
+    """
+    O-table for bwt strings over DNA-sized alphabets.
+
+    This is a sampled table, but instead of the bwt string we store it
+    packed with two bits per symbol and count the last partial block
+    with a popcount on the packed word. Counts are sampled at every
+    word. The alphabet, including $, can have at most five letters.
+    See OTable.
+    """
+
+    kind = "packed"
+
+    _length: int
+    _words: np.ndarray
+    _sentinel: int
+    _samples: np.ndarray
+
+    def __init__(self, bwt: bytearray, asize: int) -> None:
+        """
+        Create the packed O-table.
+
+        Compute the O-table from the bwt transformed string and the size
+        of the alphabet the bwt string is over.
+        """
+        assert asize <= 5, "Can only pack four letters plus sentinel"
+        self._length = len(bwt)
+        self._words = pack_2bit(bwt)
+        # $ and letter 1 share a code, so we must remember where $ is.
+        self._sentinel = bwt.index(0)
+        self._samples = _block_samples(bwt, asize, SYMBOLS_PER_WORD)
+
+    @property
+    def asize(self) -> int:
+        """Get the size of the alphabet the table is over, including $."""
+        return len(self._samples) + 1
+
+    def rank(self, a: int, i: int) -> int:
+        """Get the number of occurrences j < i where bwt[j] == a."""
+        block, r = divmod(i, SYMBOLS_PER_WORD)
+        count = int(self._samples[a - 1, block])
+        if r == 0:
+            return count
+        # XOR with a broadcast of a's code leaves 00 exactly where the
+        # symbols match. Fold each pair of bits into its low bit to
+        # get a mismatch bit per symbol, and count the zeros among the
+        # first r symbols.
+        x = int(self._words[block]) ^ ((a - 1) * _LOW_BITS)
+        mismatch = (x | (x >> 1)) & _LOW_BITS
+        match = ~mismatch & _LOW_BITS & ((1 << (2 * r)) - 1)
+        count += match.bit_count()
+        if a == 1 and block * SYMBOLS_PER_WORD <= self._sentinel < i:
+            count -= 1  # we counted $ as an a
+        return count
+
+    def search_kernel(self) -> SearchKernel:
+        """Get the compiled backward search and the arguments it needs."""
+        return bwt_kernels.packed_backward_search, \
+            (self._samples, self._words, self._sentinel, self._length)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Get the arrays that make up the table, see from_arrays()."""
+        return {
+            "length": np.asarray(self._length),
+            "words": self._words,
+            "sentinel": np.asarray(self._sentinel),
+            "samples": self._samples,
+        }
+
+    @staticmethod
+    def from_arrays(length: np.ndarray, words: np.ndarray,
+                    sentinel: np.ndarray,
+                    samples: np.ndarray) -> _PackedOTable:
+        """Rebuild a packed O-table from the arrays we got from arrays()."""
+        otab = _PackedOTable.__new__(_PackedOTable)
+        otab._length = int(length)
+        otab._words = words
+        otab._sentinel = int(sentinel)
+        otab._samples = samples
+        return otab
+
+
+# We keep the full O-table when it has fewer entries than this, which
+# is a bwt string of 1 MiB over DNA, and sample it otherwise.
+DENSE_OTABLE_LIMIT = 1 << 22
+
+_OTABLE_KINDS: dict[str, Any] = {
+    impl.kind: impl
+    for impl in (_DenseOTable, _SampledOTable, _PackedOTable)
+}
+
 
 class OTable:
     """
@@ -71,39 +370,36 @@ class OTable:
 
     For OTable otab, otab[a,i] is the number of occurrences j < i
     where bwt[j] == a.
+
+    For short bwt strings we store the full table, which is the
+    fastest to look up in and still small. For longer strings we
+    sample the table, and pack the bwt string if the alphabet is
+    small enough.
     """
 
-    _tbl: list[list[int]]
+    _impl: _DenseOTable | _SampledOTable | _PackedOTable
 
-    def __init__(self, bwt: bytearray, asize: int) -> None:
+    def __init__(self, bwt: bytearray, asize: int,
+                 block_size: int = 64) -> None:
         """
         Create O-table.
 
         Compute the O-table from the bwt transformed string and the size
-        of the alphabet the bwt string is over.
+        of the alphabet the bwt string is over. If we sample the table
+        and do not pack the string, we sample at every block_size'th
+        index.
         """
-        # We exclude $ from lookups, so there are this many
-        # rows.
-        nrow = asize - 1
-        # We need to index to len(bwt), but we don't represent first column
-        # so there are len(bwt) columns.
-        ncol = len(bwt)
-
-        self._tbl = [[0] * ncol for _ in range(nrow)]
-
-        # The first column is all zeros, the second
-        # should hold a 1 in the row that has character
-        # bwt[0]. The we b-1 because of the sentinel and
-        # we use column 0 for the first real column.
-        self._tbl[bwt[0] - 1][0] = 1
-
-        # We already have cols 0 and 1. Now we need to
-        # go up to (and including) len(bwt).
-        for i in range(2, len(bwt) + 1):
-            b = bwt[i - 1]
-            # Characters, except for sentinel
-            for a in range(1, asize):
-                self._tbl[a - 1][i - 1] = self._tbl[a - 1][i - 2] + (a == b)
+        if (asize - 1) * len(bwt) < DENSE_OTABLE_LIMIT:
+            self._impl = _DenseOTable(bwt, asize)
+        elif asize <= 5:
+            self._impl = _PackedOTable(bwt, asize)
+        else:
+            self._impl = _SampledOTable(bwt, asize, block_size)
+
+    @property
+    def asize(self) -> int:
+        """Get the size of the alphabet the table is over, including $."""
+        return self._impl.asize
 
     def __getitem__(self, idx: tuple[int, int]) -> int:
         """
@@ -113,14 +409,40 @@ class OTable:
         """
         a, i = idx
         assert a > 0, "Don't look up the sentinel"
-        return 0 if i == 0 else self._tbl[a - 1][i - 1]
+        return self._impl.rank(a, i)
+
+    def rank(self, a: int, i: int) -> int:
+        """
+        Get the number of occurrences j < i where bwt[j] == a.
+
+        This is the same as otab[a,i] but without packing the
+        arguments in a tuple, which matters in the search loop. It
+        also skips otab[a,i]'s check that a isn't the sentinel, so the
+        caller must make sure a > 0; ExactSearcher.interval() does.
+        """
+        return self._impl.rank(a, i)
+
+    def search_kernel(self) -> SearchKernel:
+        """Get the compiled backward search and the arguments it needs."""
+        return self._impl.search_kernel()
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Get the arrays that make up the table, see from_arrays()."""
+        return {"kind": np.asarray(self._impl.kind), **self._impl.arrays()}
+
+    @staticmethod
+    def from_arrays(kind: np.ndarray, **arrays: np.ndarray) -> OTable:
+        """Rebuild an O-table from the arrays we got from arrays()."""
+        otab = OTable.__new__(OTable)
+        otab._impl = _OTABLE_KINDS[str(kind)].from_arrays(**arrays)
+        return otab
 
 
 class FMIndexTables(NamedTuple):
     """Preprocessed FMIndex tables."""
 
     alpha: Alphabet
-    sa: list[int]
+    sa: np.ndarray
     ctab: CTable
     otab: OTable
 
@@ -128,34 +450,140 @@ class FMIndexTables(NamedTuple):
 def preprocess_exact(x: str) -> FMIndexTables:
     """Preprocess tables for exact FM/bwt search."""
     bwt, alpha, sa = burrows_wheeler_transform(x)
-    ctab = CTable(bwt, len(alpha))
     otab = OTable(bwt, len(alpha))
+    ctab = CTable.from_otable(otab, len(bwt))
     return FMIndexTables(alpha, sa, ctab, otab)
 
 
-def exact_searcher_from_tables(tbls: FMIndexTables) -> ExactSearchFunc:
-    """Build an exact search function from preprocessed tables."""
-    alpha, sa, ctab, otab = tbls
+def tables_to_arrays(tbls: FMIndexTables) -> dict[str, np.ndarray]:
+    """
+    Flatten preprocessed tables into named NumPy arrays.
+
+    This is what we save when we preprocess a genome, together with
+    the alphabet, and tables_from_arrays() gets the tables back.
+    """
+    _, sa, ctab, otab = tbls
+    arrays = {
+        "sa": sa,
+    }
+    for prefix, tbl in (("ctab", ctab), ("otab", otab)):
+        for key, arr in tbl.arrays().items():
+            arrays[f"{prefix}.{key}"] = arr
+    return arrays
+
+
+def tables_from_arrays(alpha: Alphabet,
+                       arrays: Mapping[str, np.ndarray]) -> FMIndexTables:
+    """Rebuild preprocessed tables from tables_to_arrays() arrays."""
+    def table_arrays(prefix: str) -> dict[str, np.ndarray]:
+        return {
+            key.removeprefix(prefix): arr
+            for key, arr in arrays.items() if key.startswith(prefix)
+        }
+
+    ctab = CTable.from_arrays(**table_arrays("ctab."))
+    otab = OTable.from_arrays(**table_arrays("otab."))
+    return FMIndexTables(alpha, arrays["sa"], ctab, otab)
+
+
+def _python_backward_search(p_rev: bytes, ctab: list[int],
+                            rank: Callable[[int, int], int],
+                            n: int) -> tuple[int, int]:
+    """
+    Find the suffix array interval for a reversed mapped pattern.
+
+    This is the Python version of the bwt_kernels backward searches.
+    Everything the loop needs is an argument, so the interpreter looks
+    them all up as fast locals.
+    """
+    left, right = 0, n
+    for a in p_rev:
+        c = ctab[a]
+        left = c + rank(a, left)
+        right = c + rank(a, right)
+        if left >= right:
+            return 0, 0  # no matches
+    return left, right
+
 
-    def search(p_: str) -> Iterator[int]:
+class ExactSearcher:
+    """
+    Exact search in preprocessed FM-index tables.
+
+    Calling an ExactSearcher with a pattern gives us the positions
+    where the pattern occurs in the preprocessed string.
+    """
+
+    __slots__ = (
+        '_alpha', '_sa', '_n', '_ctab', '_rank', '_kernel', '_kernel_args'
+    )
+
+    _alpha: Alphabet
+    _sa: np.ndarray
+    _n: int
+    _ctab: list[int]
+    _rank: Callable[[int, int], int]
+    _kernel: Callable[..., tuple[int, int]] | None
+    _kernel_args: tuple[Any, ...]
+
+    def __init__(self, tbls: FMIndexTables) -> None:
+        """Set up the search from the preprocessed tables."""
+        alpha, sa, ctab, otab = tbls
+        self._alpha = alpha
+        self._sa = sa
+        self._n = len(sa)
+        # Keep the plain list and the representation's own bound rank
+        # method, so the Python search loop doesn't go through
+        # __getitem__, tuple packing, or OTable's delegation for every
+        # character.
+        # pylint: disable=protected-access
+        self._ctab = ctab._cumsum
+        self._rank = otab._impl.rank
+        self._kernel = None
+        self._kernel_args = ()
+        if bwt_kernels.HAVE_NUMBA:
+            kernel, otab_args = otab.search_kernel()
+            self._kernel = kernel
+            self._kernel_args = \
+                (np.asarray(self._ctab, dtype=np.int64), *otab_args)
+            self.interval(bytes())  # compile, or load from cache, up front
+
+    def interval(self, p_rev: bytes) -> tuple[int, int]:
+        """
+        Find the suffix array interval for a mapped pattern.
+
+        The pattern is given reversed, as p_rev, and the interval is
+        empty if the pattern doesn't occur in the string. The pattern
+        cannot contain the sentinel, since the ranks don't check for it.
+        """
+        assert 0 not in p_rev, "Don't look up the sentinel"
+        if self._kernel is not None:
+            return self._kernel(np.frombuffer(p_rev, dtype=np.uint8),
+                                *self._kernel_args)
+        return _python_backward_search(p_rev, self._ctab, self._rank, self._n)
+
+    def __call__(self, p_: str) -> Iterator[int]:
+        """Search for p_ and iterate through the positions of the matches."""
         try:
-            p = alpha.map(p_)
+            try:
+                p = self._alpha.map_bytes(p_.encode("latin-1"))
+            except UnicodeEncodeError:
+                p = bytes(self._alpha.map(p_))  # letters beyond latin-1
+                if 0 in p:
+                    return  # the sentinel is not a letter in the string
         except KeyError:
             return  # can't map, so no matches
 
-        # Find interval of matches...
-        left, right = 0, len(sa)
-        for a in reversed(p):
-            left = ctab[a] + otab[a, left]
-            right = ctab[a] + otab[a, right]
-            if left >= right:
-                return  # no matches
+        # Find interval of matches, running through p from the back...
+        left, right = self.interval(p[::-1])
+
+        # Report the matches, as Python ints, in one go
+        yield from self._sa[left:right].tolist()
 
-        # Report the matches
-        for i in range(left, right):
-            yield sa[i]
 
-    return search
+def exact_searcher_from_tables(tbls: FMIndexTables) -> ExactSearchFunc:
+    """Build an exact search function from preprocessed tables."""
+    return ExactSearcher(tbls)
 
 
 def exact_preprocess(x: str) -> ExactSearchFunc:
@@ -0,0 +1,134 @@
+"""
+Compiled kernels for the FM-index backward search.
+
+The kernels are compiled with Numba when it is installed. Without it,
+HAVE_NUMBA is False and the functions are plain Python, which is far
+too slow for searching but still gives the right answers, so the
+search code falls back to its own Python loop instead.
+"""
+
+from typing import Any, Callable
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # pragma: no cover
+    HAVE_NUMBA = False
+
+    def njit(*_args: Any, **_kwargs: Any) -> Callable[[Any], Any]:
+        """Leave the function as it is when we cannot compile it."""
+        return lambda f: f
+
+# Number of 2-bit symbols we pack into a 64-bit word.
+SYMBOLS_PER_WORD = 32
+# The low bit of every 2-bit symbol in a word.
+LOW_BITS = np.uint64(0x5555555555555555)
+
+# Masks for counting bits in a word where only the low bit of each
+# 2-bit symbol can be set.
+_PAIRS = np.uint64(0x3333333333333333)
+_NIBBLES = np.uint64(0x0F0F0F0F0F0F0F0F)
+_BYTES = np.uint64(0x0101010101010101)
+
+
+@njit(cache=True, nogil=True)
+def dense_backward_search(p_rev: np.ndarray, C: np.ndarray,
+                          tbl: np.ndarray) -> tuple[int, int]:
+    """
+    Find the suffix array interval for a reversed mapped pattern.
+
+    This is backward_search for a full O-table, where tbl[a-1,i] is
+    the number of occurrences of a in bwt[:i].
+    """
+    left, right = 0, tbl.shape[1] - 1
+    for a in p_rev:
+        c = C[a]
+        left = c + np.int64(tbl[a - 1, left])
+        right = c + np.int64(tbl[a - 1, right])
+        if left >= right:
+            return 0, 0  # no matches
+    return left, right
+
+
+@njit(cache=True, nogil=True)
+def rank(a: int, i: int, samples: np.ndarray,
+         bwt: np.ndarray, block_size: int) -> int:
+    """Count occurrences of a in bwt[:i] from sampled counts."""
+    block = i // block_size
+    count = np.int64(samples[a - 1, block])
+    for j in range(block * block_size, i):
+        if bwt[j] == a:
+            count += 1
+    return count
+
+
+@njit(cache=True, nogil=True)
+def backward_search(p_rev: np.ndarray, C: np.ndarray, samples: np.ndarray,
+                    bwt: np.ndarray, block_size: int) -> tuple[int, int]:
+    """
+    Find the suffix array interval for a mapped pattern.
+
+    The pattern is given reversed, as p_rev, so we can run through it
+    from the front. Returns the interval as a (left, right) pair, which
+    is empty if the pattern doesn't occur in the string.
+    """
+    left, right = 0, len(bwt)
+    for a in p_rev:
+        c = C[a]
+        left = c + rank(a, left, samples, bwt, block_size)
+        right = c + rank(a, right, samples, bwt, block_size)
+        if left >= right:
+            return 0, 0  # no matches
+    return left, right
+
+
+@njit(cache=True, nogil=True)
+def _popcount_low_bits(x: np.uint64) -> int:
+    """Count the set bits in x when only the low bit of each pair is set."""
+    x = (x & _PAIRS) + ((x >> np.uint64(2)) & _PAIRS)
+    x = (x + (x >> np.uint64(4))) & _NIBBLES
+    return np.int64((x * _BYTES) >> np.uint64(56))
+
+
+@njit(cache=True, nogil=True)
+def packed_rank(a: int, i: int, samples: np.ndarray,
+                words: np.ndarray, sentinel: int) -> int:
+    """Count occurrences of a in bwt[:i] from a 2-bit packed bwt."""
+    block = i // SYMBOLS_PER_WORD
+    r = i % SYMBOLS_PER_WORD
+    count = np.int64(samples[a - 1, block])
+    if r == 0:
+        return count
+    # Zero pairs in x are the symbols that match a; see bwt._PackedOTable.
+    x = words[block] ^ (np.uint64(a - 1) * LOW_BITS)
+    mismatch = (x | (x >> np.uint64(1))) & LOW_BITS
+    prefix = (np.uint64(1) << np.uint64(2 * r)) - np.uint64(1)
+    count += _popcount_low_bits(~mismatch & LOW_BITS & prefix)
+    if a == 1 and block * SYMBOLS_PER_WORD <= sentinel < i:
+        count -= 1  # we counted $ as an a
+    return count
+
+
+# Generating a search specialised to the alphabet, with a branch per
+# letter, searched no faster and cost a compile in every process,
+# since Numba can't cache generated code, so all packed O-tables
+# share this kernel.
+@njit(cache=True, nogil=True)
+def packed_backward_search(p_rev: np.ndarray, C: np.ndarray,
+                           samples: np.ndarray, words: np.ndarray,
+                           sentinel: int, n: int) -> tuple[int, int]:
+    """
+    Find the suffix array interval for a reversed mapped pattern.
+
+    This is backward_search for a 2-bit packed bwt of length n.
+    """
+    left, right = 0, n
+    for a in p_rev:
+        c = C[a]
+        left = c + packed_rank(a, left, samples, words, sentinel)
+        right = c + packed_rank(a, right, samples, words, sentinel)
+        if left >= right:
+            return 0, 0  # no matches
+    return left, right
@@ -0,0 +1,59 @@
+"""Test the compiled bwt kernels."""
+
+import numpy as np
+
+from test_helpers import check_ranks, random_string
+import bwt
+import bwt_kernels
+
+
+def test_rank() -> None:
+    """Test that the kernel ranks agree with direct counting."""
+    x = random_string(100, alpha="acgtn")
+    transformed, alpha, _ = bwt.burrows_wheeler_transform(x)
+    bwt_np = np.frombuffer(transformed, dtype=np.uint8)
+    for block_size in (1, 3, 64):
+        otab = bwt._SampledOTable(  # pylint: disable=protected-access
+            transformed, len(alpha), block_size
+        )
+        samples = otab._samples  # pylint: disable=protected-access
+        check_ranks(
+            lambda a, i: bwt_kernels.rank(a, i, samples, bwt_np, block_size),
+            transformed, len(alpha)
+        )
+
+
+def test_packed_rank() -> None:
+    """Test that the packed kernel ranks agree with direct counting."""
+    x = random_string(100, alpha="acgt")
+    transformed, alpha, _ = bwt.burrows_wheeler_transform(x)
+    otab = bwt._PackedOTable(  # pylint: disable=protected-access
+        transformed, len(alpha)
+    )
+    _, (samples, words, sentinel, _) = otab.search_kernel()
+    check_ranks(
+        lambda a, i: bwt_kernels.packed_rank(a, i, samples, words, sentinel),
+        transformed, len(alpha)
+    )
+
+
+def test_backward_search() -> None:
+    """Test that the kernels find the same intervals as the O-tables."""
+    x = random_string(200, alpha="acgt")
+    bwt_, alpha, _ = bwt.burrows_wheeler_transform(x)
+    ctab = bwt.CTable(bwt_, len(alpha))
+    C = np.asarray(ctab._cumsum)  # pylint: disable=protected-access
+    # pylint: disable=protected-access
+    for otab in (bwt._DenseOTable(bwt_, len(alpha)),
+                 bwt._SampledOTable(bwt_, len(alpha), 64),
+                 bwt._PackedOTable(bwt_, len(alpha))):
+        kernel, args = otab.search_kernel()
+        for p_ in ("", "a", "acg", "tttttttt", x[10:20]):
+            p = alpha.map(p_)
+            left, right = 0, len(bwt_)
+            for a in reversed(p):
+                left = ctab[a] + otab.rank(a, left)
+                right = ctab[a] + otab.rank(a, right)
+            expected = (left, right) if left < right else (0, 0)
+            assert kernel(np.frombuffer(p[::-1], dtype=np.uint8), C, *args) \
+                == expected
@@ -1,11 +1,28 @@
 """Test bwt."""
 
-from test_helpers import check_matches
+from typing import Any
+
+import numpy as np
+import pytest
+
+from test_helpers import check_matches, check_ranks, random_string
 import alphabet
 import bwt
 import sais
 
 
+def otable_impls(bwt_: bytearray, asize: int) -> list[Any]:
+    """Build every O-table representation that can handle bwt_."""
+    # pylint: disable=protected-access
+    impls: list[Any] = [
+        bwt._DenseOTable(bwt_, asize),
+        bwt._SampledOTable(bwt_, asize, 7),
+    ]
+    if asize <= 5:
+        impls.append(bwt._PackedOTable(bwt_, asize))
+    return impls
+
+
 def test_ctable() -> None:
     """Test C-table."""
     x, alpha = alphabet.Alphabet.mapped_string_with_sentinel("aabca")
@@ -16,21 +33,91 @@ def test_ctable() -> None:
     assert ctab[3] == 5, "$ + three 'a' + one 'b'"
 
 
+def test_ctable_from_otable() -> None:
+    """Test building the C-table from the O-table."""
+    for x in ("", "aabca", random_string(100, alpha="acgt"),
+              random_string(100, alpha="acgtn")):
+        transformed, alpha, _ = bwt.burrows_wheeler_transform(x)
+        ctab = bwt.CTable(transformed, len(alpha))
+        for otab in otable_impls(transformed, len(alpha)):
+            ctab2 = bwt.CTable.from_otable(otab, len(transformed))
+            for a in range(len(alpha)):
+                assert ctab2[a] == ctab[a]
+
+
 def test_otable() -> None:
     """Test O-table."""
     x = "aabca"
     transformed, alpha, _ = bwt.burrows_wheeler_transform(x)
     assert transformed == bytearray([1, 3, 0, 1, 1, 2])
 
-    # we shouldn't look at private members, of course, but
-    # we are only testing...
-    # pylint: disable=protected-access
     otab = bwt.OTable(transformed, len(alpha))
-    assert len(otab._tbl) == len(alpha) - 1
-    assert len(otab._tbl[0]) == len(transformed)
-    assert otab._tbl[0] == [1, 1, 1, 2, 3, 3], "a counts"
-    assert otab._tbl[1] == [0, 0, 0, 0, 0, 1], "b counts"
-    assert otab._tbl[2] == [0, 1, 1, 1, 1, 1], "c counts"
+    expected = {
+        1: [0, 1, 1, 1, 2, 3, 3],  # a counts
+        2: [0, 0, 0, 0, 0, 0, 1],  # b counts
+        3: [0, 0, 1, 1, 1, 1, 1],  # c counts
+    }
+    for a, counts in expected.items():
+        assert [otab[a, i] for i in range(len(transformed) + 1)] == counts
+
+
+def test_otable_block_sizes() -> None:
+    """Test that the sampled O-table agrees with direct counting."""
+    x = random_string(50, alpha="acgt")
+    transformed, alpha, _ = bwt.burrows_wheeler_transform(x)
+    for block_size in (1, 2, 3, 7, 64):
+        # pylint: disable=protected-access
+        otab = bwt._SampledOTable(transformed, len(alpha), block_size)
+        check_ranks(otab.rank, transformed, len(alpha))
+
+
+def test_otable_tiles(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that building O-tables over several tiles works."""
+    monkeypatch.setattr(bwt, "OTABLE_TILE", 8)
+    x = random_string(100, alpha="acgt")
+    transformed, alpha, _ = bwt.burrows_wheeler_transform(x)
+    # pylint: disable=protected-access
+    for otab in (*otable_impls(transformed, len(alpha)),
+                 bwt._SampledOTable(transformed, len(alpha), 3),
+                 bwt._SampledOTable(transformed, len(alpha), 16)):
+        check_ranks(otab.rank, transformed, len(alpha))
+
+
+def test_pack_2bit() -> None:
+    """Test the bit layout of the packed bwt words."""
+    assert list(bwt.pack_2bit(bytearray())) == []
+    assert list(bwt.pack_2bit(bytearray([1, 2, 3, 4]))) == [0xe4]
+    words = bwt.pack_2bit(bytearray([2, 0, 1, 4, 3, 3, 2, 1] * 5))
+    assert words.dtype == np.uint64
+    assert list(words) == [0x1ac11ac11ac11ac1, 0x1ac1]
+
+
+def test_packed_otable() -> None:
+    """Test that the packed O-table agrees with direct counting."""
+    for n in (0, 1, 31, 32, 63, 64, 100):
+        for letters in ("a", "ac", "acg", "acgt"):
+            x = random_string(n, alpha=letters)
+            transformed, alpha, _ = bwt.burrows_wheeler_transform(x)
+            # pylint: disable=protected-access
+            otab = bwt._PackedOTable(transformed, len(alpha))
+            check_ranks(otab.rank, transformed, len(alpha))
+
+
+def test_otable_kinds(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that we search correctly with each O-table representation."""
+    for limit, letters, kind in ((bwt.DENSE_OTABLE_LIMIT, "acgt", "dense"),
+                                 (0, "acgt", "packed"),
+                                 (0, "acgtn", "sampled")):
+        monkeypatch.setattr(bwt, "DENSE_OTABLE_LIMIT", limit)
+        x = random_string(200, alpha=letters)
+        tbls = bwt.preprocess_exact(x)
+        assert tbls.otab.arrays()["kind"] == kind
+        search = bwt.exact_searcher_from_tables(tbls)
+        for p in ("a", "acg", "", x[10:20], x[50:52], "\x00", "a\x00"):
+            matches = list(search(p))
+            check_matches(x, p, matches)
+            assert len(matches) == \
+                sum(x.startswith(p, i) for i in range(len(x) + 1))
 
 
 def test_mississippi() -> None:
@@ -46,3 +133,28 @@ def test_mississippi() -> None:
         check_matches(x, p, matches)
     # the empty string should give us the entire x includng sentinel
     assert len(list(search(""))) == len(x) + 1
+
+
+def test_python_search(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the search without compiled kernels."""
+    monkeypatch.setattr(bwt.bwt_kernels, "HAVE_NUMBA", False)
+    for x in ("mississippi", random_string(100, alpha="acgtn")):
+        search = bwt.exact_preprocess(x)
+        for p in ("si", "ppi", "ssi", "pip", "x", "", x[10:20],
+                  "\x00", "s\x00", "\x00\u03b1"):
+            matches = list(search(p))
+            check_matches(x, p, matches)
+            assert len(matches) == \
+                sum(x.startswith(p, i) for i in range(len(x) + 1))
+
+
+def test_tables_arrays_roundtrip() -> None:
+    """Test that we get the same searches back from the saved arrays."""
+    for x in ("mississippi", random_string(100, alpha="acgtn")):
+        tbls = bwt.preprocess_exact(x)
+        search = bwt.exact_searcher_from_tables(tbls)
+        loaded = bwt.exact_searcher_from_tables(
+            bwt.tables_from_arrays(tbls.alpha, bwt.tables_to_arrays(tbls))
+        )
+        for p in ("si", "ppi", "x", "", x[10:20]):
+            assert list(loaded(p)) == list(search(p))
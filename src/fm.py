@@ -1,17 +1,63 @@
 """FM-index exact pattern matching."""
 
 import argparse
+import itertools
+import os
 import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, TextIO
 
 from preprocess import (
     preprocess,
-    load_preprocessed
+    load_preprocessed,
+    GENOME_SEARCH
 )
 from fasta import read_fasta
 from fastq import scan_reads
 from sam import ssam_record
 
 
+# Number of reads we search in each task when searching in parallel.
+READ_BATCH_SIZE = 1000
+# Number of batches per worker we have submitted at any time. Bounding
+# this keeps us from reading all the reads, and holding all the hits,
+# before we write any output.
+BATCHES_PER_WORKER = 2
+
+# A read is a (name, sequence) pair, and a hit is a read name, a
+# chromosome name, the position of the match, and the read sequence.
+READ = tuple[str, str]
+HIT = tuple[str, str, int, str]
+
+
+def batches(reads: Iterable[READ], size: int) -> Iterator[list[READ]]:
+    """Split reads into lists of (at most) size reads."""
+    itr = iter(reads)
+    while batch := list(itertools.islice(itr, size)):
+        yield batch
+
+
+def search_reads(genome_searchers: GENOME_SEARCH,
+                 reads: list[READ]) -> list[HIT]:
+    """Search for all reads in all chromosomes."""
+    return [
+        (read_name, chr_name, i, read_seq)
+        for read_name, read_seq in reads
+        for chr_name, search in genome_searchers.items()
+        for i in search(read_seq)
+    ]
+
+
+def write_hits(out: TextIO, hits: Iterable[HIT]) -> None:
+    """Write hits in simple-SAM format."""
+    for read_name, chr_name, i, read_seq in hits:
+        ssam_record(out,
+                    read_name, chr_name,
+                    i, f"{len(read_seq)}M",
+                    read_seq)
+
+
 def main() -> None:
     """FM-index exact pattern matching."""
     argparser = argparse.ArgumentParser(
@@ -43,13 +89,29 @@ def main() -> None:
             sys.exit(1)
 
         genome_searchers = load_preprocessed(args.genome.name+".fm-idx")
-        for read_name, read_seq in scan_reads(args.reads):
-            for chr_name, search in genome_searchers.items():
-                for i in search(read_seq):
-                    ssam_record(sys.stdout,
-                                read_name, chr_name,
-                                i, f"{len(read_seq)}M",
-                                read_seq)
+        read_batches = batches(scan_reads(args.reads), READ_BATCH_SIZE)
+        workers = os.cpu_count() or 1
+        if workers == 1:
+            # Threads only add overhead on one CPU.
+            for reads in read_batches:
+                write_hits(sys.stdout, search_reads(genome_searchers, reads))
+        else:
+            # The compiled kernels don't hold the GIL, but search_reads
+            # holds it everywhere else, and we haven't measured a gain
+            # from threads on several cores yet. We keep a bounded
+            # window of submitted batches and write the oldest batch's
+            # hits before we submit another, so we still stream through
+            # the reads and write the hits in the order of the reads.
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending: deque[Future[list[HIT]]] = deque()
+                for reads in read_batches:
+                    if len(pending) >= BATCHES_PER_WORKER * workers:
+                        write_hits(sys.stdout, pending.popleft().result())
+                    pending.append(executor.submit(
+                        search_reads, genome_searchers, reads
+                    ))
+                while pending:
+                    write_hits(sys.stdout, pending.popleft().result())
 
 
 if __name__ == '__main__':
@@ -1,8 +1,15 @@
 """Code for preprocessing a genome for FM-index search."""
 
+import os
 import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
 from bwt import (
     preprocess_exact,
+    tables_to_arrays,
+    tables_from_arrays,
     exact_searcher_from_tables,
     ExactSearchFunc
 )
@@ -14,21 +21,54 @@ GENOME = dict[str, str]
 # instead.
 GENOME_SEARCH = dict[str, ExactSearchFunc]
 
+# Arrays smaller than this, in bytes, go in the index pickle instead of
+# getting their own .npy file.
+SMALL_ARRAY_BYTES = 4096
+
 
 def preprocess(genome: GENOME, preproc_file_name: str) -> None:
-    """Preprocess a genome and pickle the generated search functions."""
-    preprocessed = {
-        name: preprocess_exact(seq) for name, seq in genome.items()
-    }
+    """Preprocess a genome and save the tables for the search functions."""
+    # The chromosomes are independent, so we build their tables in
+    # parallel processes.
+    with ProcessPoolExecutor() as executor:
+        preprocessed = dict(zip(
+            genome, executor.map(preprocess_exact, genome.values())
+        ))
+    # The index file is a pickle with each chromosome's alphabet and
+    # small arrays, and the names of .npy files with the large arrays,
+    # which we can memory map when we load them.
+    index = {}
+    for k, (name, tbls) in enumerate(preprocessed.items()):
+        arrays: dict[str, np.ndarray | str] = {}
+        for key, arr in tables_to_arrays(tbls).items():
+            if arr.nbytes < SMALL_ARRAY_BYTES:
+                arrays[key] = arr
+            else:
+                # Chromosome names need not be valid in file names,
+                # so we use the chromosome's index instead.
+                array_file_name = f"{preproc_file_name}.{k}.{key}.npy"
+                np.save(array_file_name, arr)
+                arrays[key] = os.path.basename(array_file_name)
+        index[name] = (tbls.alpha, arrays)
     with open(preproc_file_name, "wb") as preproc_file:
-        pickle.dump(preprocessed, preproc_file)
+        pickle.dump(index, preproc_file)
 
 
 def load_preprocessed(preproc_file_name: str) -> GENOME_SEARCH:
     """Load preprocessed tables and make them into search functions."""
     with open(preproc_file_name, "rb") as preproc_file:
-        preproc_tables = pickle.load(preproc_file)
-    return {
-        name: exact_searcher_from_tables(tbl)
-        for name, tbl in preproc_tables.items()
-    }
+        index = pickle.load(preproc_file)
+    # The arrays are mapped read-only, so the pages are shared, through
+    # the page cache, with other processes searching the same genome.
+    preproc_dir = os.path.dirname(preproc_file_name)
+    searchers = {}
+    for name, (alpha, arrays) in index.items():
+        for key, arr in arrays.items():
+            if isinstance(arr, str):
+                arrays[key] = np.load(
+                    os.path.join(preproc_dir, arr), mmap_mode='r'
+                )
+        searchers[name] = exact_searcher_from_tables(
+            tables_from_arrays(alpha, arrays)
+        )
+    return searchers
@@ -105,3 +105,12 @@ def check_equal_matches(x: str, p: str,
     print('Iters:', iters)
     for res in zip(*iters, strict=True):  # type: ignore
         assert all(res[i] == res[0] for i in range(1, len(res)))
+
+
+def check_ranks(rank: Callable[[int, int], int],
+                transformed: bytearray, asize: int) -> None:
+    """Check that rank(a, i) counts the a's in transformed[:i]."""
+    for a in range(1, asize):
+        for i in range(len(transformed) + 1):
+            assert rank(a, i) == transformed[:i].count(a), \
+                f"rank({a}, {i}) should be {transformed[:i].count(a)}"